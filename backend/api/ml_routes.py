@@ -1,20 +1,95 @@
-from fastapi import APIRouter, UploadFile
+from fastapi import APIRouter, HTTPException, UploadFile
+from fastapi.responses import ORJSONResponse
+from typing import Optional
 from ml_models.gnn.model import ValidatorGNN
 from ml_models.nlp.code_analyzer import CodeRiskAnalyzer
+import asyncio
 import json
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 gnn_model = ValidatorGNN()
 code_analyzer = CodeRiskAnalyzer()
 
+# Ограничения на загружаемые .sol файлы
+MAX_UPLOAD_SIZE = 1_000_000
+ALLOWED_CONTENT_TYPES = {"text/plain", "text/x-solidity", "application/octet-stream"}
+
+# Микробатчинг /code/analyze: запросы копятся до BATCH_MAX_SIZE штук или BATCH_WINDOW секунд
+BATCH_MAX_SIZE = 16
+BATCH_WINDOW = 0.05
+
+_analyze_queue: Optional[asyncio.Queue] = None
+_batch_worker: Optional[asyncio.Task] = None
+_batch_loop_owner: Optional[asyncio.AbstractEventLoop] = None
+
+async def analyze_batched(code: str) -> dict:
+    """Ставит код в очередь батчера и ждёт свой результат"""
+    global _analyze_queue, _batch_worker, _batch_loop_owner
+    # попадание в кеш отдаём сразу, без окна батчинга и перехода в поток
+    cached = code_analyzer.cached_risk(code)
+    if cached is not None:
+        return cached
+
+    # Перезапуск, если воркер упал или создан в другом (закрытом) event loop - TestClient, reload
+    loop = asyncio.get_running_loop()
+    if _batch_worker is None or _batch_worker.done() or _batch_loop_owner is not loop:
+        _analyze_queue = asyncio.Queue()
+        _batch_worker = loop.create_task(_batch_loop(_analyze_queue))
+        _batch_loop_owner = loop
+
+    future = loop.create_future()
+    await _analyze_queue.put((code, future))
+    return await future
+
+async def _batch_loop(queue: asyncio.Queue):
+    """Фоновая задача: собирает батч и прогоняет его через модель одним вызовом"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + BATCH_WINDOW
+        while len(batch) < BATCH_MAX_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        codes = [code for code, _ in batch]
+        try:
+            results = await asyncio.to_thread(code_analyzer.analyze_contracts, codes)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
 @router.post("/gnn/predict")
 async def predict_risk(graph_data: dict):
     return gnn_model.predict_risk(graph_data)
 
 @router.post("/code/analyze")
 async def analyze_code(file: UploadFile):
-    content = await file.read()
+    # сравниваем только media type: "text/plain; charset=utf-8" -> "text/plain"
+    if file.content_type:
+        media_type = file.content_type.split(";", 1)[0].strip().lower()
+        if media_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(415, f"Unsupported content type: {file.content_type}")
+
+    # читаем не больше лимита + 1 байт, чтобы не держать в памяти огромные загрузки
+    data = await file.read(MAX_UPLOAD_SIZE + 1)
+    if len(data) > MAX_UPLOAD_SIZE:
+        raise HTTPException(413, "File too large")
+
+    # декодируем один раз и переиспользуем строку для обоих анализов
+    content = data.decode("utf-8", errors="replace")
+    del data
     return {
-        "overall_risk": code_analyzer.analyze_contract(content.decode()),
-        "vulnerabilities": code_analyzer.detect_vulnerabilities(content.decode())
+        "overall_risk": await analyze_batched(content),
+        "vulnerabilities": code_analyzer.detect_vulnerabilities(content)
     }
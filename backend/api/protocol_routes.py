@@ -1,18 +1,27 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from protocols.uniswap.router import UniswapV3Router
 from web3 import Web3
+from core.blockchain.providers import make_http_provider
 
 router = APIRouter()
-w3 = Web3(Web3.HTTPProvider("https://mainnet.infura.io/v3/YOUR_KEY"))
+w3 = Web3(make_http_provider("https://mainnet.infura.io/v3/YOUR_KEY"))
 
+# Роутер Uniswap создаётся один раз при импорте (ABI загружается однократно)
+UNISWAP_V3_ROUTER_ADDRESS = "0xE592427A0AEce92De3Edee1F18E0157C05861564"
+UNISWAP_V3 = UniswapV3Router(w3, UNISWAP_V3_ROUTER_ADDRESS)
+
+def get_uniswap_router() -> UniswapV3Router:
+    return UNISWAP_V3
+
+# Обычный def: FastAPI выполняет его в пуле потоков, поиск маршрута не блокирует event loop
 @router.get("/uniswap/route")
-async def get_swap_route(
+def get_swap_route(
     token_in: str, 
     token_out: str,
-    amount: int
+    amount: int,
+    uniswap_router: UniswapV3Router = Depends(get_uniswap_router)
 ):
-    router = UniswapV3Router(w3, "0xE592427A0AEce92De3Edee1F18E0157C05861564")
     try:
-        return router.find_optimal_route(token_in, token_out, amount)
+        return uniswap_router.find_optimal_route(token_in, token_out, amount)
     except Exception as e:
         raise HTTPException(400, str(e))
@@ -1,49 +1,109 @@
-import requests
-from typing import Dict, List, Optional
-from web3 import Web3
-from tenacity import retry, stop_after_attempt
+import asyncio
+from types import MappingProxyType
+from typing import Dict, List, Optional, Tuple
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+from tenacity import retry, stop_after_attempt, wait_exponential
+from core.blockchain.providers import make_http_provider
+
+# LayerZero v1 chain_id -> имя цепи
+_CHAIN_ID_TO_NAME = MappingProxyType({
+    101: "ethereum",
+    102: "bsc",
+    106: "avalanche",
+    109: "polygon",
+    110: "arbitrum"
+})
+
+# Интервал опроса целевой цепи при ожидании доставки (только HTTP, без подписок)
+DELIVERY_POLL_INTERVAL = 1.0
+# Сколько последних блоков целевой цепи просматривать при первой проверке доставки
+DELIVERY_LOOKBACK_BLOCKS = 2000
+# Размер страницы eth_getLogs: публичные RPC (bsc-dataseed и т.п.) режут большие диапазоны
+DELIVERY_LOGS_PAGE = 500
+# Событие доставки LayerZero v1 - эмитит UltraLightNodeV2 целевой цепи (не Endpoint):
+#   PacketReceived(uint16 indexed srcChainId, bytes srcAddress, address indexed dstAddress,
+#                  uint64 nonce, bytes32 payloadHash)
+# nonce не индексирован: на узле фильтруем по topic0 + srcChainId, nonce сверяем по data
+DELIVERY_EVENT_SIGNATURE = "PacketReceived(uint16,bytes,address,uint64,bytes32)"
+_DELIVERY_EVENT_DATA_TYPES = ["bytes", "uint64", "bytes32"]
+_DELIVERY_EVENT_TOPIC = "0x" + bytes(Web3.keccak(text=DELIVERY_EVENT_SIGNATURE)).hex()
+
+def _uint_topic(value: int) -> str:
+    return "0x" + value.to_bytes(32, "big").hex()
 
 class LayerZeroBridge:
     """
     Мониторинг и анализ кросс-чейн транзакций через LayerZero.
     Поддерживаемые цепи: Ethereum, BSC, Avalanche, Polygon, Arbitrum.
     """
+
+    # ABI контракта LayerZero Endpoint (основные функции)
+    _ENDPOINT_ABI = [{
+        "inputs": [
+            {"name": "dstChainId", "type": "uint16"},
+            {"name": "payload", "type": "bytes"},
+            {"name": "payInZRO", "type": "bool"},
+            {"name": "adapterParams", "type": "bytes"}
+        ],
+        "name": "estimateFees",
+        "outputs": [{"name": "fee", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    }]
     
     def __init__(self, config: Dict):
         """
         :param config: {
-            "ethereum": {"rpc": "https://eth.llamarpc.com", "chain_id": 101},
-            "bsc": {"rpc": "https://bsc-dataseed.binance.org", "chain_id": 102},
+            "ethereum": {"rpc": "https://eth.llamarpc.com", "chain_id": 101, "uln": "0x..."},
+            "bsc": {"rpc": "https://bsc-dataseed.binance.org", "chain_id": 102, "uln": "0x..."},
             "layerzero_endpoint": "0x66A71Dcef29A0fFBDBE3c6a460a3B5BC225Cd675"
         }
         """
         self.chains = {
-            "ethereum": Web3(Web3.HTTPProvider(config["ethereum"]["rpc"])),
-            "bsc": Web3(Web3.HTTPProvider(config["bsc"]["rpc"]))
+            "ethereum": Web3(make_http_provider(config["ethereum"]["rpc"])),
+            "bsc": Web3(make_http_provider(config["bsc"]["rpc"]))
         }
+        # Асинхронные клиенты для отслеживания сообщений
+        self.async_chains = {
+            name: AsyncWeb3(AsyncHTTPProvider(config[name]["rpc"]))
+            for name in self.chains
+        }
+        self.chain_ids = {name: config[name]["chain_id"] for name in self.chains}
+        # Адрес UltraLightNodeV2 на каждой цепи: источник событий доставки PacketReceived
+        self.uln_addresses = {name: config[name].get("uln") for name in self.chains}
         self.endpoint = config["layerzero_endpoint"]
+        # Контракт Endpoint собираем один раз на цепь, а не на каждый вызов
+        self._endpoint_contracts = {
+            name: w3.eth.contract(address=self.endpoint, abi=self._ENDPOINT_ABI)
+            for name, w3 in self.chains.items()
+        }
         
-    @retry(stop=stop_after_attempt(3))
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.05, max=0.5))
     def get_message_fee(self, from_chain: str, to_chain: str) -> int:
         """
         Получает预估 gas fee для кросс-чейн транзакции.
         """
-        endpoint_contract = self.chains[from_chain].eth.contract(
-            address=self.endpoint,
-            abi=self._load_endpoint_abi()
-        )
-        fee = endpoint_contract.functions.estimateFees(
-            self.chains[to_chain]["chain_id"],
+        fee = self._endpoint_contracts[from_chain].functions.estimateFees(
+            self.chain_ids[to_chain],
             "0x",  # Пример payload
             False,  # Оплата в нативном токене
             "0x"    # Адрес получателя (пусто для расчета)
         ).call()
         return fee
 
-    def track_message(self, tx_hash: str, from_chain: str) -> Dict:
+    async def track_messages(self, tx_hashes: List[str], from_chain: str) -> List[Dict]:
+        """Параллельно отслеживает несколько кросс-чейн сообщений."""
+        return await asyncio.gather(
+            *(self.track_message(tx_hash, from_chain) for tx_hash in tx_hashes)
+        )
+
+    async def track_message(self, tx_hash: str, from_chain: str, wait_timeout: float = 0) -> Dict:
         """
         Отслеживает статус кросс-чейн сообщения.
         
+        :param wait_timeout: сколько секунд ждать доставки, опрашивая целевую цепь
+            раз в DELIVERY_POLL_INTERVAL (0 - одна проверка)
+        
         :return: {
             "src_chain": "ethereum",
             "dst_chain": "bsc",
@@ -51,7 +111,7 @@ class LayerZeroBridge:
             "dst_tx_hash": str | None
         }
         """
-        tx_receipt = self.chains[from_chain].eth.get_transaction_receipt(tx_hash)
+        tx_receipt = await self.async_chains[from_chain].eth.get_transaction_receipt(tx_hash)
         logs = self._parse_layerzero_logs(tx_receipt.logs)
         
         if not logs:
@@ -63,46 +123,70 @@ class LayerZeroBridge:
             "status": "pending"
         }
         
-        # Проверяем доставку в целевой цепи
-        dst_chain = self.chains[message["dst_chain"]]
-        dst_tx_hash = self._find_destination_tx(dst_chain, logs["nonce"])
-        if dst_tx_hash:
-            message.update({"status": "delivered", "dst_tx_hash": dst_tx_hash})
+        uln = self.uln_addresses.get(message["dst_chain"])
+        if not uln:
+            message["error"] = "ULN address not configured for destination chain"
+            return message
+
+        # Проверяем доставку в целевой цепи; повторные опросы смотрят только новые блоки
+        dst_chain = self.async_chains[message["dst_chain"]]
+        topics = [_DELIVERY_EVENT_TOPIC, _uint_topic(self.chain_ids[from_chain])]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait_timeout
+        from_block = None
+        while True:
+            dst_tx_hash, from_block = await self._find_destination_tx(
+                dst_chain, uln, topics, logs["nonce"], from_block
+            )
+            if dst_tx_hash:
+                message.update({"status": "delivered", "dst_tx_hash": dst_tx_hash})
+                break
+            if loop.time() + DELIVERY_POLL_INTERVAL > deadline:
+                break
+            await asyncio.sleep(DELIVERY_POLL_INTERVAL)
         
         return message
 
-    def _load_endpoint_abi(self) -> List[Dict]:
-        """ABI контракта LayerZero Endpoint (основные функции)."""
-        return [{
-            "inputs": [
-                {"name": "dstChainId", "type": "uint16"},
-                {"name": "payload", "type": "bytes"},
-                {"name": "payInZRO", "type": "bool"},
-                {"name": "adapterParams", "type": "bytes"}
-            ],
-            "name": "estimateFees",
-            "outputs": [{"name": "fee", "type": "uint256"}],
-            "stateMutability": "view",
-            "type": "function"
-        }]
+    async def _find_destination_tx(
+        self, w3: AsyncWeb3, uln: str, topics: List[str], nonce: int, from_block: Optional[int]
+    ) -> Tuple[Optional[str], int]:
+        """
+        Ищет в целевой цепи PacketReceived с тем же nonce: узел фильтрует по topics,
+        nonce сверяется по декодированной data. Страницы по DELIVERY_LOGS_PAGE блоков
+        от новых к старым.
+        
+        :return: (хеш транзакции доставки или None, блок, с которого продолжать опрос)
+        """
+        latest = await w3.eth.block_number
+        if from_block is None:
+            from_block = max(latest - DELIVERY_LOOKBACK_BLOCKS, 0)
+        to_block = latest
+        while to_block >= from_block:
+            page_start = max(to_block - DELIVERY_LOGS_PAGE + 1, from_block)
+            logs = await w3.eth.get_logs({
+                "address": uln,
+                "topics": topics,
+                "fromBlock": page_start,
+                "toBlock": to_block
+            })
+            for log in logs:
+                _, log_nonce, _ = w3.codec.decode(_DELIVERY_EVENT_DATA_TYPES, log["data"])
+                if log_nonce == nonce:
+                    return log["transactionHash"].hex(), latest + 1
+            to_block = page_start - 1
+        return None, latest + 1
 
     def _parse_layerzero_logs(self, logs: List) -> Optional[Dict]:
         """Парсит логи контракта на события Send/Receive."""
         for log in logs:
             if log.address == self.endpoint:
                 return {
-                    "dstChainId": int(log.topics[1].hex(), 16),
-                    "nonce": int(log.topics[2].hex(), 16)
+                    # топики - HexBytes (подкласс bytes): читаем число без hex-строки
+                    "dstChainId": int.from_bytes(log.topics[1], "big"),
+                    "nonce": int.from_bytes(log.topics[2], "big")
                 }
         return None
 
     def _chain_id_to_name(self, chain_id: int) -> str:
         """Конвертирует LayerZero chain_id в имя цепи."""
-        mapping = {
-            101: "ethereum",
-            102: "bsc",
-            109: "avalanche",
-            110: "polygon",
-            110: "arbitrum"
-        }
-        return mapping.get(chain_id, "unknown")
+        return _CHAIN_ID_TO_NAME.get(chain_id, "unknown")
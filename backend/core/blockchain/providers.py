@@ -0,0 +1,24 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from web3 import Web3
+
+def _build_rpc_session() -> requests.Session:
+    """HTTP-сессия для JSON-RPC: пул keep-alive соединений, gzip и повторы при обрыве соединения"""
+    session = requests.Session()
+    session.headers.update({"Accept-Encoding": "gzip"})
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=64,
+        max_retries=Retry(total=3, backoff_factor=0.1)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Одна сессия на процесс, общая для всех провайдеров
+RPC_SESSION = _build_rpc_session()
+
+def make_http_provider(url: str, timeout: float = 5) -> Web3.HTTPProvider:
+    """HTTPProvider поверх общей сессии (без нового TCP/TLS рукопожатия на каждый запрос)"""
+    return Web3.HTTPProvider(url, session=RPC_SESSION, request_kwargs={"timeout": timeout})
@@ -0,0 +1,49 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+def digest(text: str) -> bytes:
+    """16-байтный blake2b-дайджест: ключ кеша вместо самого (длинного) текста"""
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+class LRUCache:
+    """
+    Потокобезопасный LRU (OrderedDict + lock) с необязательным TTL.
+    Лок держится только на операциях со словарём, поэтому годится и для async-кода.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (время записи, значение)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        """Значение или None (нет ключа либо истёк TTL)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable):
+        """Вычисление идёт вне лока: параллельные промахи по одному ключу считают дважды"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
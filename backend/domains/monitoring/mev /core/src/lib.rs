@@ -119,3 +119,67 @@ pub extern "C" fn mev_detector_analyze(
         ptr::null_mut()
     }
 }
+
+/// Результат детекции для бинарного FFI: заполняется в буфере вызывающей стороны
+#[repr(C)]
+pub struct MevAlertRaw {
+    pub alert_type: [u8; 16], // ASCII, дополнен нулями
+    pub profit_eth: f64,
+    pub risk_score: f64,
+}
+
+/// Разбор бинарного Tx (little-endian):
+/// [u16 len][to][f64 value][f64 gas_price][u32 len][input]
+fn decode_tx_raw(buf: &[u8]) -> Option<ffi::Tx> {
+    fn take<'a>(buf: &mut &'a [u8], n: usize) -> Option<&'a [u8]> {
+        if buf.len() < n {
+            return None;
+        }
+        let (head, tail) = buf.split_at(n);
+        *buf = tail;
+        Some(head)
+    }
+
+    let mut rest = buf;
+    let to_len = u16::from_le_bytes(take(&mut rest, 2)?.try_into().ok()?) as usize;
+    let to = std::str::from_utf8(take(&mut rest, to_len)?).ok()?.to_owned();
+    let value = f64::from_le_bytes(take(&mut rest, 8)?.try_into().ok()?);
+    let gas_price = f64::from_le_bytes(take(&mut rest, 8)?.try_into().ok()?);
+    let input_len = u32::from_le_bytes(take(&mut rest, 4)?.try_into().ok()?) as usize;
+    let input = take(&mut rest, input_len)?.to_vec();
+
+    Some(ffi::Tx { to, value, gas_price, input })
+}
+
+/// Бинарный вариант mev_detector_analyze: без serde_json на входе и без
+/// аллокации CString на выходе.
+/// Возвращает 1 и заполняет `out`, если найден алерт, 0 - если нет, -1 - при ошибке формата.
+#[no_mangle]
+pub extern "C" fn mev_detector_analyze_raw(
+    detector: *mut MevDetector,
+    tx_buf: *const u8,
+    tx_len: usize,
+    out: *mut MevAlertRaw,
+) -> i32 {
+    let detector = unsafe { &mut *detector };
+    let buf = unsafe { std::slice::from_raw_parts(tx_buf, tx_len) };
+
+    let tx = match decode_tx_raw(buf) {
+        Some(tx) => tx,
+        None => return -1,
+    };
+
+    match detector.analyze(tx) {
+        Some(alert) => {
+            let out = unsafe { &mut *out };
+            let name = alert.alert_type.as_bytes();
+            let n = name.len().min(out.alert_type.len());
+            out.alert_type = [0; 16];
+            out.alert_type[..n].copy_from_slice(&name[..n]);
+            out.profit_eth = alert.profit_eth;
+            out.risk_score = alert.risk_score as f64;
+            1
+        }
+        None => 0,
+    }
+}
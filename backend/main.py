@@ -1,13 +1,21 @@
 from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
 from typing import Optional, List, Dict
+import asyncio
 import logging
 from enum import Enum
+import anyio
 import httpx
 from web3 import Web3
-import networkx as nx
+from core.blockchain.providers import make_http_provider
+from core.cache import LRUCache, digest
+try:
+    import ahocorasick
+except ImportError:  # без pyahocorasick сканируем обычным поиском подстрок
+    ahocorasick = None
 import json
 from datetime import datetime
 
@@ -60,7 +68,8 @@ app = FastAPI(
     description="API для анализа и мониторинга DeFi протоколов и смарт-контрактов",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=ORJSONResponse
 )
 
 # Настройки CORS
@@ -81,13 +90,29 @@ async def get_api_key(api_key: str = Depends(api_key_header)):
     return api_key
 
 # подключаем клиентов для внешних API
-etherscan_client = httpx.AsyncClient(base_url="https://api.etherscan.io/api")
-bscscan_client = httpx.AsyncClient(base_url="https://api.bscscan.com/api")
-defillama_client = httpx.AsyncClient(base_url="https://api.llama.fi")
+# keep-alive + HTTP/2 переиспользуют TCP/TLS, gzip сжимает ответы с исходниками (100KB+)
+HTTP_HEADERS = {"Accept-Encoding": "gzip"}
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32)
+
+etherscan_client = httpx.AsyncClient(
+    base_url="https://api.etherscan.io/api", headers=HTTP_HEADERS, http2=True, limits=HTTP_LIMITS
+)
+bscscan_client = httpx.AsyncClient(
+    base_url="https://api.bscscan.com/api", headers=HTTP_HEADERS, http2=True, limits=HTTP_LIMITS
+)
+defillama_client = httpx.AsyncClient(
+    base_url="https://api.llama.fi", headers=HTTP_HEADERS, http2=True, limits=HTTP_LIMITS
+)
+
+# Кеш исходников: (blockchain, address) -> (время загрузки, result[0] эксплорера).
+# Код задеплоенного контракта неизменен, TTL нужен только для неверифицированных контрактов
+SOURCE_CACHE_MAXSIZE = 4096
+SOURCE_CACHE_TTL = 3600
+_source_cache = LRUCache(SOURCE_CACHE_MAXSIZE, ttl=SOURCE_CACHE_TTL)
 
 # Web3
-eth_w3 = Web3(Web3.HTTPProvider("https://mainnet.infura.io/v3/YOUR_INFURA_KEY"))
-bsc_w3 = Web3(Web3.HTTPProvider("https://bsc-dataseed.binance.org/"))
+eth_w3 = Web3(make_http_provider("https://mainnet.infura.io/v3/YOUR_INFURA_KEY"))
+bsc_w3 = Web3(make_http_provider("https://bsc-dataseed.binance.org/"))
 
 # Endpoints API
 @app.get("/api/health", tags=["System"])
@@ -156,7 +181,18 @@ async def list_supported_protocols():
 
 # доп функции
 async def get_contract_source(address: str, blockchain: Blockchain):
-    """Получает исходный код контракта из блокчейн-эксплорера"""
+    """Получает исходный код контракта из блокчейн-эксплорера (с LRU+TTL кешем)"""
+    key = (blockchain.value, address.lower())
+    cached = _source_cache.get(key)
+    if cached is not None:
+        return cached["SourceCode"]
+
+    result = await fetch_contract_source(address, blockchain)
+    _source_cache.put(key, result)
+    return result["SourceCode"]
+
+async def fetch_contract_source(address: str, blockchain: Blockchain) -> Dict:
+    """Запрашивает getsourcecode у эксплорера и возвращает проверенный result[0]"""
     if blockchain == Blockchain.ETHEREUM:
         params = {
             "module": "contract",
@@ -165,7 +201,7 @@ async def get_contract_source(address: str, blockchain: Blockchain):
             "apikey": "YOUR_ETHERSCAN_API_KEY"
         }
         response = await etherscan_client.get("", params=params)
-        return response.json()["result"][0]["SourceCode"]
+        return _source_result(response.json())
     elif blockchain == Blockchain.BSC:
         params = {
             "module": "contract",
@@ -174,18 +210,65 @@ async def get_contract_source(address: str, blockchain: Blockchain):
             "apikey": "YOUR_BSCSCAN_API_KEY"
         }
         response = await bscscan_client.get("", params=params)
-        return response.json()["result"][0]["SourceCode"]
+        return _source_result(response.json())
     else:
         raise NotImplementedError(f"Blockchain {blockchain} not supported yet")
 
+def _source_result(payload: Dict) -> Dict:
+    """
+    result[0] ответа getsourcecode. При ошибке эксплорера (status "0", например
+    {"result": "Max rate limit reached"}) result - строка: бросаем, чтобы она не попала в кеш
+    """
+    result = payload.get("result")
+    if (
+        payload.get("status") != "1"
+        or not isinstance(result, list)
+        or not result
+        or not isinstance(result[0], dict)
+        or "SourceCode" not in result[0]
+    ):
+        raise ValueError(f"Explorer error: {payload.get('message')}: {result}")
+    return result[0]
+
+# Токены, которые ищет analyze_security; автомат Aho–Corasick собирается один раз при импорте
+SECURITY_TOKENS = ("call.value", "require", "tx.origin")
+
+def build_token_automaton(tokens):
+    """Строит автомат Aho–Corasick по списку токенов (None, если библиотека недоступна)"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for token in tokens:
+        automaton.add_word(token, token)
+    automaton.make_automaton()
+    return automaton
+
+SECURITY_AUTOMATON = build_token_automaton(SECURITY_TOKENS)
+
+def find_tokens(source_code: str) -> set:
+    """Возвращает множество токенов SECURITY_TOKENS, встречающихся в коде, за один проход"""
+    if SECURITY_AUTOMATON is None:
+        return {token for token in SECURITY_TOKENS if token in source_code}
+    found = set()
+    for _, token in SECURITY_AUTOMATON.iter(source_code):
+        found.add(token)
+        if len(found) == len(SECURITY_TOKENS):
+            break
+    return found
+
 async def analyze_security(source_code: str, blockchain: Blockchain):
+    """Анализирует код на уязвимости в пуле потоков, не блокируя event loop"""
+    return await anyio.to_thread.run_sync(analyze_security_sync, source_code, blockchain)
+
+def analyze_security_sync(source_code: str, blockchain: Blockchain):
     """Анализирует код на уязвимости"""
     # Здесь должна быть интеграция с инстументами для анализа смарт-контрактов. А это очень упрощенная реализация для демонстрации
     
     vulnerabilities = []
+    tokens = find_tokens(source_code)
     
     # Проверка на реентерабельность
-    if "call.value" in source_code and not "require" in source_code:
+    if "call.value" in tokens and "require" not in tokens:
         vulnerabilities.append({
             "severity": "high",
             "description": "Potential reentrancy vulnerability",
@@ -193,7 +276,7 @@ async def analyze_security(source_code: str, blockchain: Blockchain):
         })
     
     # проверка подлинности транзакции в смарт-контрактах Ethereum
-    if "tx.origin" in source_code:
+    if "tx.origin" in tokens:
         vulnerabilities.append({
             "severity": "medium",
             "description": "Use of tx.origin for authorization",
@@ -213,19 +296,17 @@ def build_contract_graph(address: str, blockchain: Blockchain):
     # Здесь должна быть реальная логика построения графа
     # Это упрощенная реализация для демонстрации
     
-    G = nx.DiGraph()
-    G.add_node(address, type="main", label="Main Contract")
-
-    G.add_node(f"{address}_token", type="token", label="Token Contract")
-    G.add_node(f"{address}_oracle", type="oracle", label="Oracle")
-    
-    G.add_edge(address, f"{address}_token", label="transfer")
-    G.add_edge(address, f"{address}_oracle", label="getPrice")
-    
-    # Конвертируем в JSON для фронтенда
+    # Узлы и рёбра собираем сразу в формате фронтенда
     return {
-        "nodes": [{"id": n, **G.nodes[n]} for n in G.nodes()],
-        "edges": [{"from": u, "to": v, "label": G.edges[u, v]["label"]} for u, v in G.edges()]
+        "nodes": [
+            {"id": address, "type": "main", "label": "Main Contract"},
+            {"id": f"{address}_token", "type": "token", "label": "Token Contract"},
+            {"id": f"{address}_oracle", "type": "oracle", "label": "Oracle"}
+        ],
+        "edges": [
+            {"from": address, "to": f"{address}_token", "label": "transfer"},
+            {"from": address, "to": f"{address}_oracle", "label": "getPrice"}
+        ]
     }
 
 async def get_protocol_info(protocol: Protocol):
@@ -256,7 +337,7 @@ async def compare_versions(
     address1: str, 
     address2: str, 
     blockchain: Blockchain
-) -> Dict[str, List[Dict[str, str]]:
+) -> Dict[str, List[Dict[str, str]]]:
     """
     Сравнивает две версии смарт-контракта и возвращает различия.
     
@@ -273,9 +354,11 @@ async def compare_versions(
             ]
         }
     """
-    # 1. Получаем исходный код обеих версий
-    source1 = await get_contract_source(address1, blockchain)
-    source2 = await get_contract_source(address2, blockchain)
+    # 1. Получаем исходный код обеих версий (параллельно)
+    source1, source2 = await asyncio.gather(
+        get_contract_source(address1, blockchain),
+        get_contract_source(address2, blockchain)
+    )
     
     # 2. Парсим ABI и структуры контрактов
     abi1 = parse_abi(source1)
@@ -322,8 +405,16 @@ async def compare_versions(
     return {"changes": changes}
 
 # Вспомогательные функции
+# Кеш ABI по blake2b-дайджесту исходника: сами исходники в кеше не хранятся
+ABI_CACHE_MAXSIZE = 1024
+_abi_cache = LRUCache(ABI_CACHE_MAXSIZE)
+
 def parse_abi(source_code: str) -> List[Dict]:
-    """Парсит ABI из исходного кода контракта"""
+    """Парсит ABI из исходного кода контракта (с LRU кешем по хешу исходника)"""
+    return _abi_cache.get_or_compute(digest(source_code), lambda: extract_abi(source_code))
+
+def extract_abi(source_code: str) -> List[Dict]:
+    """Извлекает ABI из исходного кода (без кеша)"""
     #Например парсинг через solc или аналоги
     return [...]  # Пример: [{"type": "function", "name": "transfer", ...}]
 
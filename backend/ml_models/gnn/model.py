@@ -2,33 +2,57 @@ import torch
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv, global_mean_pool
 from torch_geometric.data import Data
+from torch_geometric.transforms import GCNNorm, ToSparseTensor
+
+# Бакеты CUDA graph: узлы - степени двойки от MIN до MAX, рёбра - фиксированный множитель
+# бакета узлов. Одна форма на бакет узлов -> число компиляций ограничено CUDA_GRAPH_NUM_BUCKETS
+CUDA_GRAPH_MIN_NODES = 16
+CUDA_GRAPH_MAX_NODES = 4096
+CUDA_GRAPH_EDGE_FACTOR = 8
+CUDA_GRAPH_NUM_BUCKETS = (CUDA_GRAPH_MAX_NODES // CUDA_GRAPH_MIN_NODES).bit_length()
+
+def _next_pow2(n: int) -> int:
+    return 1 << (n - 1).bit_length()
 
 class ValidatorGNN(torch.nn.Module):
     def __init__(self, num_features=8, hidden_dim=64, num_classes=3):
         super().__init__()
-        self.conv1 = GCNConv(num_features, hidden_dim)
-        self.conv2 = GCNConv(hidden_dim, hidden_dim)
+        # Нормализация смежности выполняется заранее (GCNNorm в _preprocess / prepare_datasets)
+        self.conv1 = GCNConv(num_features, hidden_dim, normalize=False)
+        self.conv2 = GCNConv(hidden_dim, hidden_dim, normalize=False)
         self.classifier = torch.nn.Linear(hidden_dim, num_classes)
+        # torch.compile-версия forward для инференса на GPU (создаётся лениво)
+        self._compiled_forward = None
         
     def forward(self, data: Data):
         # data.x: [num_nodes, num_features]
-        # data.edge_index: [2, num_edges]
-        
-        x = self.conv1(data.x, data.edge_index)
+        # data.adj_t: нормализованная SparseTensor [num_nodes, num_nodes]
+        # (или data.edge_index [2, num_edges] + data.edge_weight)
+        if "adj_t" in data:
+            return self._forward(data.x, data.adj_t, None, data.batch)
+        return self._forward(data.x, data.edge_index, data.edge_weight, data.batch)
+
+    def _forward(self, x, edge_index, edge_weight, batch, num_graphs=None):
+        x = self.conv1(x, edge_index, edge_weight)
         x = F.relu(x)
         x = F.dropout(x, p=0.5, training=self.training)
-        x = self.conv2(x, data.edge_index)
+        x = self.conv2(x, edge_index, edge_weight)
         
         # Градуированный пулинг
-        x = global_mean_pool(x, data.batch)
+        x = global_mean_pool(x, batch, num_graphs)
         return self.classifier(x)
 
     def predict_risk(self, graph_data: dict) -> dict:
         """Интерфейс для предсказания"""
         self.eval()
+        device = next(self.parameters()).device
         with torch.no_grad():
-            data = self._preprocess(graph_data)
-            out = self.forward(data)
+            data = self._preprocess(graph_data).to(device)
+            if device.type == "cuda":
+                out = self._forward_cuda_graph(data)
+            else:
+                # CSR + fused SpMM вместо scatter по COO
+                out = self.forward(ToSparseTensor(attr="edge_weight")(data))
             probs = F.softmax(out, dim=1)
             
         return {
@@ -37,7 +61,45 @@ class ValidatorGNN(torch.nn.Module):
             "high_risk": probs[0][2].item()
         }
 
+    def _forward_cuda_graph(self, data: Data) -> torch.Tensor:
+        """
+        Forward на формах, дополненных до бакета: torch.compile(mode="reduce-overhead")
+        захватывает CUDA graph один раз на бакет и дальше только воспроизводит его.
+        Графы крупнее бакетов идут через обычный forward.
+        """
+        num_nodes = data.num_nodes
+        num_edges = data.edge_index.size(1)
+        # минимум один фиктивный узел под паддинг рёбер
+        node_bucket = max(_next_pow2(num_nodes + 1), CUDA_GRAPH_MIN_NODES)
+        edge_bucket = node_bucket * CUDA_GRAPH_EDGE_FACTOR
+        if node_bucket > CUDA_GRAPH_MAX_NODES or num_edges > edge_bucket:
+            return self._forward(data.x, data.edge_index, data.edge_weight, None)
+
+        if self._compiled_forward is None:
+            torch.set_float32_matmul_precision("high")
+            # каждый бакет - отдельная компиляция (dynamic=False): лимит dynamo должен их вместить
+            from torch import _dynamo
+            _dynamo.config.cache_size_limit = max(_dynamo.config.cache_size_limit, CUDA_GRAPH_NUM_BUCKETS)
+            self._compiled_forward = torch.compile(self._forward, mode="reduce-overhead", dynamic=False)
+
+        pad_node = node_bucket - 1
+
+        x = data.x.new_zeros((node_bucket, data.x.size(1)))
+        x[:num_nodes] = data.x
+        edge_index = data.edge_index.new_full((2, edge_bucket), pad_node)
+        edge_index[:, :num_edges] = data.edge_index
+        # паддинговые рёбра с нулевым весом ничего не вносят в агрегацию
+        edge_weight = data.edge_weight.new_zeros(edge_bucket)
+        edge_weight[:num_edges] = data.edge_weight
+        # Фиктивные узлы относим ко второму графу, чтобы они не влияли на пулинг основного
+        batch = torch.ones(node_bucket, dtype=torch.long, device=x.device)
+        batch[:num_nodes] = 0
+
+        return self._compiled_forward(x, edge_index, edge_weight, batch, 2)[:1].clone()
+
     def _preprocess(self, raw_data: dict) -> Data:
         edge_index = torch.tensor(raw_data["connections"], dtype=torch.long)
         node_features = torch.tensor(raw_data["node_features"], dtype=torch.float)
-        return Data(x=node_features, edge_index=edge_index.t().contiguous())
+        data = Data(x=node_features, edge_index=edge_index.t().contiguous())
+        # нормализованная матрица смежности (self-loops + D^-1/2 A D^-1/2) считается один раз
+        return GCNNorm()(data)
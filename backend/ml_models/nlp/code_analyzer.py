@@ -1,42 +1,141 @@
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from typing import Optional
+from pathlib import Path
+import logging
 import torch
+from core.cache import LRUCache, digest
+try:
+    import ahocorasick
+except ImportError:  # без pyahocorasick сканируем обычным поиском подстрок
+    ahocorasick = None
+
+VULNERABILITY_PATTERNS = {
+    "reentrancy": ["call.value", "send(", "transfer("],
+    "overflow": ["unchecked", "++", "--"],
+    "access_control": ["tx.origin", "public"]
+}
+
+def _build_vulnerability_automaton():
+    """Автомат Aho–Corasick: ключевое слово -> типы уязвимостей"""
+    if ahocorasick is None:
+        return None
+    labels = {}
+    for vuln_type, keywords in VULNERABILITY_PATTERNS.items():
+        for keyword in keywords:
+            labels.setdefault(keyword, []).append(vuln_type)
+    automaton = ahocorasick.Automaton()
+    for keyword, vuln_types in labels.items():
+        automaton.add_word(keyword, tuple(vuln_types))
+    automaton.make_automaton()
+    return automaton
+
+VULNERABILITY_AUTOMATON = _build_vulnerability_automaton()
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MAXSIZE = 2048
 
 class CodeRiskAnalyzer:
-    def __init__(self, model_path: str = "microsoft/codebert-base"):
+    def __init__(
+        self,
+        model_path: str = "microsoft/codebert-base",
+        onnx_dir: str = "models/codebert-int8"
+    ):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModelForSequenceClassification.from_pretrained(model_path).to(self.device)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+        # Одинаковый код (клоны прокси, библиотеки) не прогоняем через модель повторно
+        self._risk_cache = LRUCache(RESULT_CACHE_MAXSIZE)
+        self._vuln_cache = LRUCache(RESULT_CACHE_MAXSIZE)
+
+        if self.device.type == "cuda":
+            # fp16 на tensor cores. Без torch.compile: батчи 1..16 с padding="longest" дают
+            # новую форму почти на каждый вызов - перекомпиляция вместо ускорения
+            self.model = AutoModelForSequenceClassification.from_pretrained(model_path).to(self.device).half().eval()
+        else:
+            self.model = self._load_quantized_model(model_path, onnx_dir)
+
+    def _load_quantized_model(self, model_path: str, onnx_dir: str):
+        """int8 (dynamic, VNNI) модель для ONNX Runtime; экспорт выполняется один раз"""
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            quantized_dir = Path(onnx_dir)
+            if not (quantized_dir / "model_quantized.onnx").exists():
+                ort_model = ORTModelForSequenceClassification.from_pretrained(model_path, export=True)
+                quantizer = ORTQuantizer.from_pretrained(ort_model)
+                quantizer.quantize(
+                    save_dir=quantized_dir,
+                    quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+                )
+            return ORTModelForSequenceClassification.from_pretrained(
+                quantized_dir, file_name="model_quantized.onnx"
+            )
+        except Exception as e:
+            logger.error(f"Failed to load quantized ONNX model, falling back to FP32: {str(e)}")
+            return AutoModelForSequenceClassification.from_pretrained(model_path)
 
     def analyze_contract(self, solidity_code: str) -> dict:
+        return self.analyze_contracts([solidity_code])[0]
+
+    def cached_risk(self, code: str) -> Optional[dict]:
+        """Результат из кеша без обращения к модели (None - не анализировался)"""
+        return self._risk_cache.get(digest(code))
+
+    def analyze_contracts(self, codes: list) -> list:
+        """Батчевый анализ с кешем: через модель идут только ещё не виденные исходники"""
+        keys = [digest(code) for code in codes]
+        results = [self._risk_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        if missing:
+            computed = self._run_model([codes[i] for i in missing])
+            for i, result in zip(missing, computed):
+                results[i] = result
+                self._risk_cache.put(keys[i], result)
+
+        return results
+
+    def _run_model(self, codes: list) -> list:
+        """Один вызов токенайзера и один forward на весь список"""
         inputs = self.tokenizer(
-            solidity_code,
+            codes,
             truncation=True,
-            padding=True,
+            padding="longest",
             max_length=512,
             return_tensors="pt"
         ).to(self.device)
 
         with torch.no_grad():
             outputs = self.model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
+            probs = torch.softmax(outputs.logits, dim=1).tolist()
 
-        return {
-            "safe": probs[0][0].item(),
-            "risky": probs[0][1].item(),
-            "critical": probs[0][2].item()
-        }
+        return [
+            {"safe": p[0], "risky": p[1], "critical": p[2]}
+            for p in probs
+        ]
 
     def detect_vulnerabilities(self, code: str) -> list:
         """Поиск конкретных уязвимостей"""
-        results = []
-        patterns = {
-            "reentrancy": ["call.value", "send(", "transfer("],
-            "overflow": ["unchecked", "++", "--"],
-            "access_control": ["tx.origin", "public"]
-        }
+        key = digest(code)
+        results = self._vuln_cache.get(key)
+        if results is None:
+            results = self._scan_vulnerabilities(code)
+            self._vuln_cache.put(key, results)
+        return list(results)
 
-        for vuln_type, keywords in patterns.items():
-            if any(keyword in code for keyword in keywords):
-                results.append(vuln_type)
+    def _scan_vulnerabilities(self, code: str) -> list:
+        if VULNERABILITY_AUTOMATON is None:
+            return [
+                vuln_type for vuln_type, keywords in VULNERABILITY_PATTERNS.items()
+                if any(keyword in code for keyword in keywords)
+            ]
 
-        return results
+        # один проход по коду вместо отдельного поиска каждого ключевого слова
+        found = set()
+        for _, vuln_types in VULNERABILITY_AUTOMATON.iter(code):
+            found.update(vuln_types)
+            if len(found) == len(VULNERABILITY_PATTERNS):
+                break
+
+        return [vuln_type for vuln_type in VULNERABILITY_PATTERNS if vuln_type in found]
@@ -1,7 +1,9 @@
 import torch
 import torch.nn.functional as F
-from torch_geometric.data import Data, DataLoader
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
 from torch_geometric.nn import GATConv, global_max_pool
+from torch_geometric.transforms import Compose, GCNNorm, ToSparseTensor
 from torch.optim import AdamW
 from torch.utils.tensorboard import SummaryWriter
 import numpy as np
@@ -23,6 +25,10 @@ class GNNTrainer:
             lr=config['lr'],
             weight_decay=config['weight_decay']
         )
+        # Mixed precision: bf16 там, где поддерживается, иначе fp16 с GradScaler
+        self.use_amp = self.device.type == 'cuda'
+        self.amp_dtype = torch.bfloat16 if self.use_amp and torch.cuda.is_bf16_supported() else torch.float16
+        self.scaler = torch.cuda.amp.GradScaler(enabled=self.use_amp and self.amp_dtype == torch.float16)
         self.writer = SummaryWriter(log_dir=config['log_dir'])
         self.best_val_loss = float('inf')
 
@@ -31,13 +37,16 @@ class GNNTrainer:
         total_loss = 0
         
         for batch in loader:
-            batch = batch.to(self.device)
-            self.optimizer.zero_grad()
-            out = self.model(batch)
-            loss = F.cross_entropy(out, batch.y)
-            loss.backward()
+            batch = batch.to(self.device, non_blocking=True)
+            self.optimizer.zero_grad(set_to_none=True)
+            with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype, enabled=self.use_amp):
+                out = self.model(batch)
+                loss = F.cross_entropy(out, batch.y)
+            self.scaler.scale(loss).backward()
+            self.scaler.unscale_(self.optimizer)
             torch.nn.utils.clip_grad_norm_(self.model.parameters(), 1.0)
-            self.optimizer.step()
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
             total_loss += loss.item()
             
         return total_loss / len(loader)
@@ -47,11 +56,12 @@ class GNNTrainer:
         total_loss = 0
         correct = 0
         
-        with torch.no_grad():
+        with torch.inference_mode():
             for batch in loader:
-                batch = batch.to(self.device)
-                out = self.model(batch)
-                loss = F.cross_entropy(out, batch.y)
+                batch = batch.to(self.device, non_blocking=True)
+                with torch.autocast(device_type=self.device.type, dtype=self.amp_dtype, enabled=self.use_amp):
+                    out = self.model(batch)
+                    loss = F.cross_entropy(out, batch.y)
                 total_loss += loss.item()
                 pred = out.argmax(dim=1)
                 correct += int((pred == batch.y).sum())
@@ -71,8 +81,15 @@ class GNNTrainer:
             torch.save(state, os.path.join(self.config['checkpoint_dir'], 'best_model.pt'))
 
     def train(self, train_dataset, val_dataset):
-        train_loader = DataLoader(train_dataset, batch_size=self.config['batch_size'], shuffle=True)
-        val_loader = DataLoader(val_dataset, batch_size=self.config['batch_size'])
+        # pinned memory + воркеры: H2D копирование перекрывается с вычислениями
+        loader_kwargs = {
+            'batch_size': self.config['batch_size'],
+            'pin_memory': self.use_amp,
+            'num_workers': 4,
+            'persistent_workers': True
+        }
+        train_loader = DataLoader(train_dataset, shuffle=True, **loader_kwargs)
+        val_loader = DataLoader(val_dataset, **loader_kwargs)
         
         for epoch in range(1, self.config['epochs'] + 1):
             train_loss = self.train_epoch(train_loader)
@@ -93,33 +110,31 @@ class GNNTrainer:
 
         self.writer.close()
 
-def prepare_datasets():
+def prepare_datasets(num_train=100, num_val=20, seed=0):
     """Генерация синтетических данных для примера"""
-    train_data = []
-    val_data = []
-    
+    rng = np.random.default_rng(seed)
+    num_graphs = num_train + num_val
+
+    # Все тензоры генерируются одним векторным вызовом, графы получают срезы-view
+    num_nodes = rng.integers(5, 15, size=num_graphs)
+    num_edges = num_nodes * 2
+    x = torch.from_numpy(rng.standard_normal((num_nodes.sum(), 8), dtype=np.float32))  # 8 features per node
+    # Концы рёбер равномерно в [0, num_nodes) своего графа
+    edge_bounds = np.repeat(num_nodes, num_edges)
+    edge_index = torch.from_numpy((rng.random((2, num_edges.sum())) * edge_bounds).astype(np.int64))
+    y = torch.from_numpy(rng.integers(0, 3, size=num_graphs))
+
+    xs = torch.split(x, num_nodes.tolist())
+    edge_indices = torch.split(edge_index, num_edges.tolist(), dim=1)
+    # ValidatorGNN ожидает заранее нормализованную смежность в виде SparseTensor
+    transform = Compose([GCNNorm(), ToSparseTensor(attr="edge_weight")])
+    data = [
+        transform(Data(x=xs[i], edge_index=edge_indices[i], y=y[i]))
+        for i in range(num_graphs)
+    ]
+
     # Пример: 100 тренировочных и 20 валидационных графов
-    for i in range(100):
-        num_nodes = np.random.randint(5, 15)
-        edge_index = torch.tensor(
-            np.random.choice(num_nodes, (2, num_nodes*2)), 
-            dtype=torch.long
-        )
-        x = torch.randn((num_nodes, 8))  # 8 features per node
-        y = torch.tensor(np.random.randint(0, 3), dtype=torch.long)
-        train_data.append(Data(x=x, edge_index=edge_index, y=y))
-        
-    for i in range(20):
-        num_nodes = np.random.randint(5, 15)
-        edge_index = torch.tensor(
-            np.random.choice(num_nodes, (2, num_nodes*2)), 
-            dtype=torch.long
-        )
-        x = torch.randn((num_nodes, 8))
-        y = torch.tensor(np.random.randint(0, 3), dtype=torch.long)
-        val_data.append(Data(x=x, edge_index=edge_index, y=y))
-        
-    return train_data, val_data
+    return data[:num_train], data[num_train:]
 
 if __name__ == "__main__":
     config = {
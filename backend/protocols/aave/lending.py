@@ -9,10 +9,13 @@ class AaveV3Lending:
             address=lending_pool_address,
             abi=self.pool_abi
         )
+        # Горячие функции пула связываем один раз
+        self._get_reserve_data = self.pool.get_function_by_name("getReserveData")
+        self._get_user_reserves_data = self.pool.get_function_by_name("getUserReservesData")
 
     def get_reserve_data(self, asset_address: str) -> ReserveData:
         """Получение данных резерва"""
-        data = self.pool.functions.getReserveData(asset_address).call()
+        data = self._get_reserve_data(asset_address).call()
         return ReserveData(
             available_liquidity=data[0],
             total_debt=data[1],
@@ -22,7 +25,7 @@ class AaveV3Lending:
 
     def get_user_position(self, user_address: str) -> UserPosition:
         """Позиция пользователя"""
-        reserves = self.pool.functions.getUserReservesData(user_address).call()
+        reserves = self._get_user_reserves_data(user_address).call()
         return UserPosition(
             supplied=[(r[0], r[1]) for r in reserves[0]],
             borrowed=[(r[0], r[1]) for r in reserves[1]]
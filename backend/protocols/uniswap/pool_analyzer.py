@@ -1,6 +1,27 @@
 import numpy as np
 from dataclasses import dataclass
 from web3.contract import Contract
+from eth_abi import decode
+
+# Multicall3 задеплоен по одному адресу во всех EVM-сетях
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [{
+    "inputs": [{
+        "components": [
+            {"name": "target", "type": "address"},
+            {"name": "callData", "type": "bytes"}
+        ],
+        "name": "calls",
+        "type": "tuple[]"
+    }],
+    "name": "aggregate",
+    "outputs": [
+        {"name": "blockNumber", "type": "uint256"},
+        {"name": "returnData", "type": "bytes[]"}
+    ],
+    "stateMutability": "payable",
+    "type": "function"
+}]
 
 @dataclass
 class PoolMetrics:
@@ -12,10 +33,13 @@ class PoolMetrics:
 class UniswapPoolAnalyzer:
     def __init__(self, pool_contract: Contract):
         self.pool = pool_contract
+        self.multicall = pool_contract.w3.eth.contract(
+            address=MULTICALL3_ADDRESS,
+            abi=MULTICALL3_ABI
+        )
 
     def calculate_metrics(self) -> PoolMetrics:
-        slot0 = self.pool.functions.slot0().call()
-        liquidity = self.pool.functions.liquidity().call()
+        slot0, liquidity = self._multicall("slot0", "liquidity")
         
         return PoolMetrics(
             tvl=self._calculate_tvl(slot0, liquidity),
@@ -29,3 +53,16 @@ class UniswapPoolAnalyzer:
         sqrt_price = slot0[0]
         price = (sqrt_price ** 2) / (2 ** 192)
         return liquidity * price / 1e18
+
+    def _multicall(self, *fn_names: str) -> list:
+        """Один eth_call через Multicall3 вместо отдельного RPC на каждую view-функцию пула"""
+        calls = [(self.pool.address, self.pool.encodeABI(fn_name=name)) for name in fn_names]
+        _, return_data = self.multicall.functions.aggregate(calls).call()
+
+        results = []
+        for name, data in zip(fn_names, return_data):
+            outputs = self.pool.get_function_by_name(name).abi["outputs"]
+            values = decode([o["type"] for o in outputs], data)
+            # как и .call(): одно значение возвращаем как есть, несколько - списком
+            results.append(values[0] if len(values) == 1 else list(values))
+        return results
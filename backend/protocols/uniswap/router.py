@@ -1,45 +1,179 @@
+import heapq
+import time
+import numpy as np
+import requests
+from dataclasses import dataclass
 from web3 import Web3
 from typing import List, Dict
-from .schemas import Pool, SwapRoute
+from core.cache import LRUCache
+
+SUBGRAPH_URL = "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3"
+POOL_QUERY_LIMIT = 50
+# Пулы пары кешируются в пределах POOL_CACHE_BLOCKS блоков (~12 с на блок в mainnet);
+# окно считаем по monotonic-часам, без RPC-запроса block_number на каждый вызов
+POOL_CACHE_BLOCKS = 10
+BLOCK_TIME_SECONDS = 12
+POOL_CACHE_WINDOW = POOL_CACHE_BLOCKS * BLOCK_TIME_SECONDS
+POOL_CACHE_MAXSIZE = 4096
+
+@dataclass
+class PoolGraph:
+    """Граф пулов в CSR-форме (SoA): рёбра из токена i лежат в [indptr[i], indptr[i + 1])"""
+    token_ids: Dict[str, int]
+    tokens: List[str]
+    indptr: np.ndarray
+    neighbor: np.ndarray
+    fee: np.ndarray
+    liquidity: np.ndarray
+    pool_idx: np.ndarray
 
 class UniswapV3Router:
+    # Одна HTTP-сессия на все экземпляры: keep-alive и gzip
+    _subgraph_session = requests.Session()
+    _subgraph_session.headers.update({"Accept-Encoding": "gzip"})
+
     def __init__(self, w3: Web3, router_address: str):
         self.w3 = w3
         self.router_address = router_address
         self.router_abi = self._load_abi("uniswap_v3_router")
+        self._pool_cache = LRUCache(POOL_CACHE_MAXSIZE)
 
     def find_optimal_route(
         self,
         token_in: str,
         token_out: str,
         amount_in: int,
-        max_hops: int = 3
-    ) -> SwapRoute:
+        max_hops: int = 3,
+        beam_width: int = 16
+    ) -> Dict:
         """Поиск оптимального маршрута через граф пулов"""
         pools = self._get_available_pools(token_in, token_out)
-        routes = self._build_routes(token_in, token_out, pools, max_hops)
+        routes = self._build_routes(token_in, token_out, pools, amount_in, max_hops, beam_width)
         return self._select_best_route(routes, amount_in)
 
-    def _get_available_pools(self, token_a: str, token_b: str) -> List[Pool]:
-        """Получение пулов из Subgraph или RPC"""
-        # Пример реализации через The Graph
+    @staticmethod
+    def _select_best_route(routes: List[Dict], amount_in: int) -> Dict:
+        """_build_routes уже отсортировал маршруты по expected_out (по убыванию)"""
+        if not routes:
+            raise ValueError(f"No route found for amount {amount_in}")
+        return routes[0]
+
+    def _get_available_pools(self, token_a: str, token_b: str) -> List[Dict]:
+        """Получение пулов из Subgraph (с кешем на POOL_CACHE_BLOCKS блоков)"""
+        pair = tuple(sorted((token_a.lower(), token_b.lower())))
+        key = (pair, int(time.monotonic() // POOL_CACHE_WINDOW))
+        return self._pool_cache.get_or_compute(key, lambda: self._query_pools(*pair))
+
+    def _query_pools(self, token_a: str, token_b: str) -> List[Dict]:
+        """Запрос к The Graph: фильтрация и сортировка по ликвидности на стороне сервера"""
         query = f"""
         {{
-            pools(where: {{
-                token0_in: ["{token_a}", "{token_b}"],
-                token1_in: ["{token_a}", "{token_b}"]
-            }}) {{
+            pools(
+                first: {POOL_QUERY_LIMIT},
+                orderBy: liquidity,
+                orderDirection: desc,
+                where: {{
+                    token0_in: ["{token_a}", "{token_b}"],
+                    token1_in: ["{token_a}", "{token_b}"],
+                    liquidity_gt: "0"
+                }}
+            ) {{
                 id
                 feeTier
-                token0 {{ symbol }}
-                token1 {{ symbol }}
                 liquidity
+                token0 {{ id }}
+                token1 {{ id }}
             }}
         }}
         """
-        return self._graph_query(query)
+        return self._graph_query(query)["pools"]
+
+    def _graph_query(self, query: str) -> Dict:
+        """POST в Subgraph через общую keep-alive сессию"""
+        response = self._subgraph_session.post(SUBGRAPH_URL, json={"query": query}, timeout=10)
+        response.raise_for_status()
+        return response.json()["data"]
+
+    @staticmethod
+    def _build_pool_graph(pools: List[Dict]) -> PoolGraph:
+        """Строит CSR-смежность: каждый пул даёт два направленных ребра"""
+        token_ids: Dict[str, int] = {}
+        src, dst, fee, liquidity, pool_idx = [], [], [], [], []
+        for i, pool in enumerate(pools):
+            t0 = token_ids.setdefault(pool["token0"]["id"].lower(), len(token_ids))
+            t1 = token_ids.setdefault(pool["token1"]["id"].lower(), len(token_ids))
+            for u, v in ((t0, t1), (t1, t0)):
+                src.append(u)
+                dst.append(v)
+                fee.append(int(pool["feeTier"]))
+                liquidity.append(float(pool["liquidity"]))
+                pool_idx.append(i)
+
+        src = np.asarray(src, dtype=np.int64)
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(len(token_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(token_ids)), out=indptr[1:])
+
+        return PoolGraph(
+            token_ids=token_ids,
+            tokens=list(token_ids),
+            indptr=indptr,
+            neighbor=np.asarray(dst, dtype=np.int64)[order],
+            fee=np.asarray(fee, dtype=np.float64)[order],
+            liquidity=np.asarray(liquidity, dtype=np.float64)[order],
+            pool_idx=np.asarray(pool_idx, dtype=np.int64)[order]
+        )
+
+    def _build_routes(
+        self,
+        token_in: str,
+        token_out: str,
+        pools: List[Dict],
+        amount_in: int,
+        max_hops: int = 3,
+        beam_width: int = 16
+    ) -> List[Dict]:
+        """
+        Beam search по слоям: на каждом шаге остаются beam_width лучших частичных маршрутов.
+        Оценка выхода на ребре: amount * (1 - fee) * L / (L + amount) - учитывает комиссию
+        пула и проскальзывание относительно его ликвидности.
+        """
+        graph = self._build_pool_graph(pools)
+        src = graph.token_ids.get(token_in.lower())
+        dst = graph.token_ids.get(token_out.lower())
+        if src is None or dst is None:
+            return []
+
+        # (ожидаемый выход, путь по токенам, рёбра)
+        frontier = [(float(amount_in), [src], [])]
+        routes = []
+        for _ in range(max_hops):
+            candidates = []
+            for amount, path, edges in frontier:
+                lo, hi = graph.indptr[path[-1]], graph.indptr[path[-1] + 1]
+                if lo == hi:
+                    continue
+                neighbors = graph.neighbor[lo:hi]
+                liquidity = graph.liquidity[lo:hi]
+                out = amount * (1.0 - graph.fee[lo:hi] / 1e6) * liquidity / (liquidity + amount)
+                # без циклов по токенам
+                valid = ~np.isin(neighbors, path) & (out > 0)
+                for k in np.flatnonzero(valid):
+                    candidates.append((float(out[k]), path + [int(neighbors[k])], edges + [int(lo + k)]))
+
+            frontier = []
+            for candidate in heapq.nlargest(beam_width, candidates, key=lambda c: c[0]):
+                (routes if candidate[1][-1] == dst else frontier).append(candidate)
+            if not frontier:
+                break
 
-    def _build_routes(self, *args) -> List[SwapRoute]:
-        """Рекурсивный построитель маршрутов"""
-        # Алгоритм обхода графа пулов
-        pass
+        routes.sort(key=lambda r: r[0], reverse=True)
+        return [
+            {
+                "path": [graph.tokens[t] for t in path],
+                "pools": [pools[graph.pool_idx[e]]["id"] for e in edges],
+                "fee_tiers": [int(graph.fee[e]) for e in edges],
+                "expected_out": amount
+            }
+            for amount, path, edges in routes
+        ]
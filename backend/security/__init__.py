@@ -1,4 +1,4 @@
 from .detectors import analyze_contract_security
-from .ml_analysis import predict_risk_with_ml
+from .ml_analysis import get_analyzer
 
-__all__ = ['analyze_contract_security', 'predict_risk_with_ml']
+__all__ = ['analyze_contract_security', 'get_analyzer']
@@ -1,16 +1,114 @@
 import ast
-from typing import Dict, List, Tuple
+import atexit
+import functools
+import inspect
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 import re
 import logging
 from pathlib import Path
 from slither import Slither
 from slither.detectors import all_detectors
+from slither.detectors.abstract_detector import AbstractDetector, DetectorClassification
 from slither.core.declarations import Contract
 from crytic_compile import cryticparser
 from semantic_version import Version
 
 logger = logging.getLogger(__name__)
 
+# Backdoor-паттерны собраны в одно регулярное выражение: один проход по исходнику.
+# Исходник контролирует атакующий, поэтому никаких неограниченных .* (ReDoS)
+_BACKDOOR_RE = re.compile(
+    r"(?P<emergency>function\s+emergencyStop\(\))"
+    r"|(?P<upgrade>function\s+upgradeTo\(address\))"
+    r"|(?P<lowcall>\.call\([^;\n]{0,512}?abi\.encodeWithSelector\(0x[0-9a-f]{8})"
+)
+_BACKDOOR_FINDINGS = {
+    "emergency": ("Emergency stop without timelock", "High"),
+    "upgrade": ("Upgrade pattern without authorization", "High"),
+    "lowcall": ("Low-level call with selector", "High")
+}
+
+# Заголовок цикла for (с пробелом перед скобкой или без)
+_FOR_RE = re.compile(r"\bfor\s*\(")
+
+# Обязательные функции стандартов
+STANDARDS = {
+    "ERC20": frozenset({"totalSupply", "balanceOf", "transfer"}),
+    "ERC721": frozenset({"ownerOf", "safeTransferFrom"})
+}
+
+# Встроенные детекторы Slither по имени класса (в воркер передаётся только имя)
+_DETECTORS_BY_NAME = {
+    cls.__name__: cls
+    for cls in vars(all_detectors).values()
+    if inspect.isclass(cls) and issubclass(cls, AbstractDetector)
+}
+
+# Детекторы с IMPACT ниже порога не запускаются; переопределяется ключом min_impact в detectors_config.yml
+DEFAULT_MIN_IMPACT = "OPTIMIZATION"
+
+def _create_slither(contract_path: str) -> Slither:
+    """Инициализация с кастомными параметрами"""
+    args = cryticparser.init(
+        [
+            contract_path,
+            "--solc-solcs-select", "0.8.25",  
+            "--json", "-",
+            "--exclude-dependencies",
+            "--filter-paths", "node_modules"
+        ],
+        "SmartGuard.AI Analysis"
+    )
+    return Slither(contract_path, **vars(args))
+
+@functools.lru_cache(maxsize=4)
+def _worker_slither(contract_path: str, mtime_ns: int, size: int) -> Slither:
+    """Slither в процессе-воркере: компиляция один раз на версию файла.
+    mtime_ns и size в ключе: новая загрузка по тому же пути перекомпилируется.
+    Кеш у каждого воркера свой, поэтому первый анализ новой загрузки стоит
+    до cpu_count дополнительных сборок solc + Slither (по одной в каждом воркере)"""
+    return _create_slither(contract_path)
+
+def _run_one(contract_path: str, mtime_ns: int, size: int, detector_name: str) -> List[Dict]:
+    """Запуск одного встроенного детектора в процессе пула"""
+    slither = _worker_slither(contract_path, mtime_ns, size)
+    detector_class = _DETECTORS_BY_NAME[detector_name]
+    results = []
+    for compilation_unit in slither.compilation_units:
+        detector = detector_class(compilation_unit, slither, logging.getLogger("Detectors"))
+        results.extend(detector.detect())
+    return results
+
+# Общий пул процессов для детекторов Slither, создаётся при первом анализе
+_det_pool: Optional[ProcessPoolExecutor] = None
+_det_pool_lock = threading.Lock()
+
+def _get_detector_pool() -> ProcessPoolExecutor:
+    global _det_pool
+    if _det_pool is None:
+        with _det_pool_lock:
+            if _det_pool is None:
+                # forkserver, а не fork: fork из многопоточного процесса (пул FastAPI,
+                # потоки torch) может унаследовать захваченные локи и зависнуть
+                _det_pool = ProcessPoolExecutor(
+                    max_workers=os.cpu_count(),
+                    mp_context=multiprocessing.get_context("forkserver")
+                )
+                atexit.register(_det_pool.shutdown, wait=False, cancel_futures=True)
+    return _det_pool
+
+@functools.lru_cache(maxsize=1)
+def _load_detectors_config_cached(path: str, mtime: float) -> Dict:
+    """Парсинг YAML с кешем; mtime в ключе сбрасывает кеш при изменении файла"""
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)  # libyaml, если доступен
+    with open(path) as f:
+        return yaml.load(f, Loader=loader)
+
 class AdvancedSecurityDetector:
     """анализ безопасности для смарт-контрактов"""
     
@@ -22,9 +120,7 @@ class AdvancedSecurityDetector:
         """Загружает конфигурацию детекторов из YAML"""
         config_path = Path(__file__).parent / "detectors_config.yml"
         try:
-            import yaml
-            with open(config_path) as f:
-                return yaml.safe_load(f)
+            return _load_detectors_config_cached(str(config_path), config_path.stat().st_mtime)
         except Exception as e:
             logger.error(f"Failed to load detectors config: {e}")
             return {}
@@ -41,19 +137,27 @@ class AdvancedSecurityDetector:
         try:
             # Инициализация Slither настройками
             slither = self._init_slither(contract_path)
+
+            # Свойства Slither не кешируются и пересобирают списки при каждом обращении:
+            # снимаем их один раз на весь анализ
+            contracts = list(slither.contracts)
+            functions = list(slither.functions)
+            # у Contract нет source_code (это словарь по файлам в SlitherCore), берём текст из source_mapping
+            src_by_contract = {c: c.source_mapping.content or "" for c in contracts}
+            nodes_by_fn = {f: list(f.nodes) for f in functions}
             
             # Основной анализ
-            results.update(self._run_detectors(slither))
+            results.update(self._run_detectors(contract_path, contracts, src_by_contract))
             
             # Дополнительные проверки
             results["vulnerabilities"].extend(
                 self._check_upgrade_patterns(slither))
             results["gas_optimizations"].extend(
-                self._analyze_gas_usage(slither))
-            results["compliance"] = self._check_standards_compliance(slither)
+                self._analyze_gas_usage(functions, nodes_by_fn))
+            results["compliance"] = self._check_standards_compliance(contracts)
             
             # Анализ зависимостей
-            results["dependencies"] = self._analyze_dependencies(slither)
+            results["dependencies"] = self._analyze_dependencies(contracts, src_by_contract)
             
         except Exception as e:
             logger.error(f"Analysis failed: {e}", exc_info=True)
@@ -62,41 +166,54 @@ class AdvancedSecurityDetector:
 
     def _init_slither(self, contract_path: str) -> Slither:
         """Инициализация с кастомными параметрами"""
-        args = cryticparser.init(
-            [
-                contract_path,
-                "--solc-solcs-select", "0.8.25",  
-                "--json", "-",
-                "--exclude-dependencies",
-                "--filter-paths", "node_modules"
-            ],
-            "SmartGuard.AI Analysis"
-        )
-        return Slither(contract_path, **vars(args))
-
-    def _run_detectors(self, slither: Slither) -> Dict:
+        return _create_slither(contract_path)
+
+    def _selected_detectors(self) -> List[str]:
+        """Имена встроенных детекторов с IMPACT не ниже порога"""
+        min_impact = str(self.detectors_config.get("min_impact", DEFAULT_MIN_IMPACT)).upper()
+        try:
+            threshold = DetectorClassification[min_impact]
+        except KeyError:
+            logger.error(f"Unknown min_impact {min_impact}, running all detectors")
+            threshold = DetectorClassification[DEFAULT_MIN_IMPACT]
+        # HIGH=0 < MEDIUM < LOW < INFORMATIONAL < OPTIMIZATION; ComparableEnum не поддерживает <=, сравниваем value
+        return [
+            name for name, cls in _DETECTORS_BY_NAME.items()
+            if cls.IMPACT.value <= threshold.value
+        ]
+
+    def _run_detectors(self, contract_path: str, contracts: List[Contract], src_by_contract: Dict[Contract, str]) -> Dict:
         """Запуск кастомных и стандартных детекторов"""
         results = {"vulnerabilities": []}
         
-        # Стандартные детекторы Slither
-        for detector_class in all_detectors:
-            detector = detector_class(slither)
-            detector.detect()
-            if detector.results:
-                results["vulnerabilities"].extend(self._format_findings(detector.results))
+        # Стандартные детекторы Slither независимы и упираются в CPU: по одному на задачу в пуле процессов
+        stat = os.stat(contract_path)
+        pool = _get_detector_pool()
+        futures = {
+            pool.submit(_run_one, contract_path, stat.st_mtime_ns, stat.st_size, name): name
+            for name in self._selected_detectors()
+        }
+        for future in as_completed(futures):
+            try:
+                findings = future.result()
+            except Exception as e:
+                logger.error(f"Detector {futures[future]} failed: {e}")
+                continue
+            if findings:
+                results["vulnerabilities"].extend(self._format_findings(findings))
         
         # детекторы
-        results["vulnerabilities"].extend(self._detect_custom_issues(slither))
+        results["vulnerabilities"].extend(self._detect_custom_issues(contracts, src_by_contract))
         
         return results
 
-    def _detect_custom_issues(self, slither: Slither) -> List[Dict]:
+    def _detect_custom_issues(self, contracts: List[Contract], src_by_contract: Dict[Contract, str]) -> List[Dict]:
         """Обнаружение специфичных для DeFi уязвимостей"""
         findings = []
         
-        for contract in slither.contracts:
+        for contract in contracts:
             # Проверка на backdoor-функции
-            findings.extend(self._detect_backdoors(contract))
+            findings.extend(self._detect_backdoors(contract, src_by_contract[contract]))
             
             # Проверка на неправильные математические операции
             findings.extend(self._detect_math_issues(contract))
@@ -106,32 +223,38 @@ class AdvancedSecurityDetector:
             
         return findings
 
-    def _detect_backdoors(self, contract: Contract) -> List[Dict]:
+    def _detect_backdoors(self, contract: Contract, source_code: str) -> List[Dict]:
         """Поиск скрытых backdoor-функций"""
-        backdoor_patterns = [
-            (r"function\s+emergencyStop\(\)", "Emergency stop without timelock"),
-            (r"function\s+upgradeTo\(address\)", "Upgrade pattern without authorization"),
-            (r"\.call\(.*abi\.encodeWithSelector\(0x[0-9a-f]{8}", "Low-level call with selector")
-        ]
+        fired = {m.lastgroup for m in _BACKDOOR_RE.finditer(source_code)}
         
         findings = []
-        for pattern, description in backdoor_patterns:
-            if re.search(pattern, contract.source_code):
+        # по одной находке на сработавший паттерн, в порядке _BACKDOOR_FINDINGS
+        for group, (description, severity) in _BACKDOOR_FINDINGS.items():
+            if group in fired:
                 findings.append({
                     "check": "Backdoor Pattern",
                     "description": description,
-                    "severity": "High",
+                    "severity": severity,
                     "contract": contract.name
                 })
         return findings
 
-    def _analyze_gas_usage(self, slither: Slither) -> List[Dict]:
+    def _analyze_gas_usage(self, functions: List, nodes_by_fn: Dict) -> List[Dict]:
         """Анализ оптимизации"""
         gas_issues = []
         
-        for function in slither.functions:
+        for function in functions:
+            # Один проход по узлам: циклы и чтения storage
+            has_loop = False
+            storage_access = 0
+            for node in nodes_by_fn[function]:
+                if not has_loop and _FOR_RE.search(node.source_mapping.content):
+                    has_loop = True
+                if "SLOAD" in str(node):
+                    storage_access += 1
+
             # Проверка на дорогие циклы
-            if any("for(" in node.source_mapping.content for node in function.nodes):
+            if has_loop:
                 gas_issues.append({
                     "issue": "Expensive loop",
                     "function": function.name,
@@ -139,7 +262,6 @@ class AdvancedSecurityDetector:
                 })
                 
             # Проверка на повторяющиеся операции
-            storage_access = sum(1 for node in function.nodes if "SLOAD" in str(node))
             if storage_access > 5:
                 gas_issues.append({
                     "issue": "Excessive storage reads",
@@ -149,28 +271,23 @@ class AdvancedSecurityDetector:
                 
         return gas_issues
 
-    def _check_standards_compliance(self, slither: Slither) -> Dict:
+    def _check_standards_compliance(self, contracts: List[Contract]) -> Dict:
         """Проверка соответствия стандартам (ERC-20, ERC-721 и т.д.)"""
-        standards = {
-            "ERC20": ["totalSupply", "balanceOf", "transfer"],
-            "ERC721": ["ownerOf", "safeTransferFrom"]
-        }
-        
-        compliance = {}
-        for contract in slither.contracts:
-            for standard, funcs in standards.items():
-                compliance[standard] = all(
-                    any(f.name == func for f in contract.functions)
-                    for func in funcs
-                )
+        # стандарт считается реализованным, если его реализует хотя бы один контракт
+        compliance = dict.fromkeys(STANDARDS, False)
+        for contract in contracts:
+            names = {f.name for f in contract.functions}
+            for standard, required in STANDARDS.items():
+                if not compliance[standard] and required.issubset(names):
+                    compliance[standard] = True
         return compliance
 
-    def _analyze_dependencies(self, slither: Slither) -> Dict:
+    def _analyze_dependencies(self, contracts: List[Contract], src_by_contract: Dict[Contract, str]) -> Dict:
         """Анализ зависимостей и их версий"""
         deps = {}
-        for contract in slither.contracts:
+        for contract in contracts:
             if "@openzeppelin" in contract.source_mapping.filename.absolute:
-                version = self._extract_oz_version(contract.source_code)
+                version = self._extract_oz_version(src_by_contract[contract])
                 deps["OpenZeppelin"] = version
         return deps
 
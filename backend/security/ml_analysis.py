@@ -1,45 +1,190 @@
+import asyncio
+import importlib.util
 import logging
+import os
+import re
+import signal
+import threading
 import numpy as np
-import torch
 import onnxruntime as ort
 from typing import Dict, List, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
 from enum import Enum
-import json
+import orjson
 from pathlib import Path
+from core.cache import LRUCache, digest
 
-from transformers import (
-    AutoModelForSequenceClassification,
-    AutoTokenizer,
-    BitsAndBytesConfig,
-    pipeline
-)
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import pinecone  # Для векторного поиска
-import tensorflow as tf  # Для анализа байткода
-from web3 import Web3
+# torch, transformers, sentence_transformers и pinecone импортируются внутри методов,
+# чтобы импорт модуля (и пакета security) не тянул их без создания анализатора
+try:
+    import ahocorasick
+except ImportError:  # без pyahocorasick байткод-паттерны ищутся обычным поиском подстрок
+    ahocorasick = None
 
 logger = logging.getLogger(__name__)
 
+def _dumps_indented(value) -> str:
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+# Таймаут одной части full_analysis, сек
+ANALYSIS_TIMEOUT = 120
+
+# Защита от ReDoS в паттернах known_attacks.json:
+# группа с * или + внутри, за которой снова квантификатор, - (a+)+, (.*)*, (x|.+){2,}
+_NESTED_QUANTIFIER_RE = re.compile(r"\([^()]*[*+][^()]*\)[*+{]")
+REGEX_FUSE_SECONDS = 0.2
+_REGEX_PUMP_STRINGS = ("a" * 4096 + "!", " " * 4096 + "!", "0" * 4096 + "!", "(" * 2048)
+
+class _RegexTimeout(Exception):
+    pass
+
+def _is_regex_safe(pattern: str) -> bool:
+    """
+    Статическая проверка на вложенные квантификаторы + прогон по "накачивающим" строкам
+    под таймером (SIGALRM доступен только в главном потоке, иначе - только статическая проверка).
+    """
+    if _NESTED_QUANTIFIER_RE.search(pattern):
+        return False
+    compiled = re.compile(pattern)
+    if threading.current_thread() is not threading.main_thread() or not hasattr(signal, "setitimer"):
+        return True
+
+    def _on_timeout(signum, frame):
+        raise _RegexTimeout()
+
+    previous = signal.signal(signal.SIGALRM, _on_timeout)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, REGEX_FUSE_SECONDS)
+        for pump in _REGEX_PUMP_STRINGS:
+            compiled.search(pump)
+        return True
+    except _RegexTimeout:
+        return False
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+# Модель эмбеддингов загружается один раз на процесс
+EMBEDDING_MODEL = "all-mpnet-base-v2"
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_LENGTH = 384
+# INT8-экспорт all-mpnet-base-v2, готовится один раз:
+#   optimum-cli export onnx --model sentence-transformers/all-mpnet-base-v2 out/
+#   python -m onnxruntime.quantization.quantize_dynamic out/model.onnx models/mpnet-int8.onnx --weight_type QInt8
+EMBEDDING_ONNX_PATH = "models/mpnet-int8.onnx"
+
+_sbert_model = None
+_onnx_embedder = None  # (session, tokenizer); False - ONNX-модель недоступна
+_embedder_lock = threading.Lock()
+
+def _get_sbert(device: str) -> "SentenceTransformer":
+    global _sbert_model
+    if _sbert_model is None:
+        with _embedder_lock:
+            if _sbert_model is None:
+                from sentence_transformers import SentenceTransformer
+                _sbert_model = SentenceTransformer(EMBEDDING_MODEL, device=device)
+    return _sbert_model
+
+def _get_onnx_embedder(device: str) -> Optional[Tuple[ort.InferenceSession, "AutoTokenizer"]]:
+    global _onnx_embedder
+    if _onnx_embedder is None:
+        with _embedder_lock:
+            if _onnx_embedder is None:
+                try:
+                    from transformers import AutoTokenizer
+                    options = ort.SessionOptions()
+                    options.intra_op_num_threads = os.cpu_count() or 1
+                    session = ort.InferenceSession(
+                        EMBEDDING_ONNX_PATH,
+                        sess_options=options,
+                        providers=['CUDAExecutionProvider', 'CPUExecutionProvider'] if device == "cuda" else ['CPUExecutionProvider']
+                    )
+                    tokenizer = AutoTokenizer.from_pretrained(f"sentence-transformers/{EMBEDDING_MODEL}")
+                    _onnx_embedder = (session, tokenizer)
+                except Exception as e:
+                    logger.warning(f"ONNX embedder unavailable, using SentenceTransformer: {str(e)}")
+                    _onnx_embedder = False
+    return _onnx_embedder or None
+
+# Локальный индекс похожих контрактов (при отсутствии файлов используется Pinecone)
+FAISS_INDEX_PATH = "models/contracts.ivfpq"
+FAISS_METADATA_PATH = "models/contracts_meta.json"
+FAISS_NPROBE = 16
+
+class LocalContractIndex:
+    """FAISS IVF-PQ индекс с тем же интерфейсом query(), что у pinecone.Index"""
+
+    def __init__(self, index, metadata: Dict[int, Dict]):
+        self.index = index
+        self.metadata = metadata
+
+    @classmethod
+    def load(cls, index_path: str = FAISS_INDEX_PATH, metadata_path: str = FAISS_METADATA_PATH):
+        import faiss
+        index = faiss.read_index(index_path)
+        index.nprobe = FAISS_NPROBE
+        metadata = {int(key): value for key, value in orjson.loads(Path(metadata_path).read_bytes()).items()}
+        return cls(index, metadata)
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = True) -> Dict:
+        scores, ids = self.index.search(np.asarray([vector], dtype=np.float32), top_k)
+        return {
+            "matches": [
+                {
+                    "id": int(idx),
+                    "score": float(score),
+                    "metadata": self.metadata.get(int(idx), {}) if include_metadata else {}
+                }
+                for score, idx in zip(scores[0], ids[0])
+                if idx != -1
+            ]
+        }
+
+def build_contract_index(
+    embeddings: List[List[float]],
+    ids: List[int],
+    metadata: List[Dict],
+    index_path: str = FAISS_INDEX_PATH,
+    metadata_path: str = FAISS_METADATA_PATH,
+    nlist: int = 4096,
+    m: int = 16,
+    nbits: int = 8
+):
+    """Офлайн-сборка IVF-PQ индекса (inner product по нормализованным эмбеддингам = косинус)"""
+    import faiss
+    xb = np.vstack(embeddings).astype(np.float32)
+    dim = xb.shape[1]
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+    index.train(xb)
+    index.add_with_ids(xb, np.asarray(ids, dtype=np.int64))
+    faiss.write_index(index, index_path)
+    Path(metadata_path).write_bytes(orjson.dumps({str(idx): meta for idx, meta in zip(ids, metadata)}))
+
 class AnalysisMode(Enum):
     CODE = 1
     BYTECODE = 2
     BOTH = 3
 
 class MLSecurityAnalyzer:
+    # Веса: уязвимости кода, аномалии байткода, известные атаки, похожие контракты
+    _W = np.array([0.4, 0.3, 0.2, 0.1], dtype=np.float32)
 
     def __init__(self):
+        import torch
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self._init_models()
+        self._init_bytecode_binding()
         self._init_vector_db()
         self._load_known_attacks()
-        self.executor = ThreadPoolExecutor(max_workers=8)
-        self.w3 = Web3()
+        # Кеши по 16-байтному blake2b-дайджесту, сам текст в ключе не хранится
+        self._emb_cache = LRUCache(maxsize=10000)
+        self._attack_cache = LRUCache(maxsize=1024)
 
     def _init_models(self):
         """Инициализация всех ML моделей с квантованием"""
+        import torch
+        from transformers import BitsAndBytesConfig
         self.quant_config = BitsAndBytesConfig(
             load_in_4bit=True,
             bnb_4bit_compute_dtype=torch.float16,
@@ -59,14 +204,21 @@ class MLSecurityAnalyzer:
                 "text-generation",
                 quant=self.quant_config
             ),
-            "anomaly": self._load_tf_model(
-                "models/anomaly_detector.h5"
+            # Конвертирован из anomaly_detector.h5 один раз:
+            #   python -m tf2onnx.convert --keras models/anomaly_detector.h5 --output anomaly.onnx --opset 17
+            #   python -m onnxruntime.quantization.quantize_dynamic anomaly.onnx models/anomaly_detector.onnx
+            "anomaly": self._load_onnx_model(
+                "models/anomaly_detector.onnx"
             )
         }
 
     def _load_huggingface_model(self, model_name: str, task: str, quant=None):
         """Загрузка HF модели с обработкой ошибок"""
         try:
+            import torch
+            from transformers import pipeline
+            if task == "text-generation":
+                return self._load_generation_pipeline(model_name, quant)
             return pipeline(
                 task,
                 model=model_name,
@@ -78,27 +230,89 @@ class MLSecurityAnalyzer:
             logger.error(f"Failed to load {model_name}: {str(e)}")
             return None
 
+    def _load_generation_pipeline(self, model_name: str, quant=None):
+        """Causal LM для объяснений: FlashAttention-2 на Ampere+, иначе SDPA"""
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+        use_cuda = self.device == "cuda"
+        use_flash = (
+            use_cuda
+            and torch.cuda.get_device_capability()[0] >= 8
+            and importlib.util.find_spec("flash_attn") is not None
+        )
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            quantization_config=quant,
+            attn_implementation="flash_attention_2" if use_flash else "sdpa",
+            torch_dtype=torch.float16 if use_cuda else None,
+            device_map="auto" if use_cuda else None,
+            use_cache=True
+        )
+        # Без torch.compile: при динамическом KV-кеше и 4-битных весах bnb каждый шаг
+        # декодирования меняет формы и вызывает перекомпиляцию
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if tokenizer.pad_token_id is None:
+            # для батчевой генерации: паддинг слева токеном EOS
+            tokenizer.pad_token_id = tokenizer.eos_token_id
+            tokenizer.padding_side = "left"
+
+        return pipeline("text-generation", model=model, tokenizer=tokenizer)
+
     def _load_onnx_model(self, path: str):
         """Загрузка ONNX"""
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.enable_cpu_mem_arena = True
         try:
             return ort.InferenceSession(
                 path,
+                sess_options=options,
                 providers=['CUDAExecutionProvider' if self.device == "cuda" else 'CPUExecutionProvider']
             )
         except Exception as e:
             logger.error(f"Failed to load ONNX model {path}: {str(e)}")
             return None
 
-    def _load_tf_model(self, path: str):
-        try:
-            return tf.keras.models.load_model(path)
-        except Exception as e:
-            logger.error(f"Failed to load TF model {path}: {str(e)}")
-            return None
+    def _init_bytecode_binding(self):
+        """IOBinding для bytecode-модели на GPU: вход в заранее выделенном буфере, выход сразу на хост"""
+        self._bytecode_binding = None
+        self._bytecode_input = None
+        self._bytecode_lock = threading.Lock()
+        session = self.models["bytecode_analysis"]
+        if session is None or self.device != "cuda":
+            return
+        self._bytecode_binding = session.io_binding()
+        for output in session.get_outputs():
+            self._bytecode_binding.bind_output(output.name, "cpu")
+
+    def _run_bytecode_model(self, features: np.ndarray) -> np.ndarray:
+        """Инференс bytecode-модели; на CUDA без аллокаций и лишних копий на каждый вызов"""
+        session = self.models["bytecode_analysis"]
+        if self._bytecode_binding is None:
+            return session.run(None, {"bytecode": features})[0]
+
+        with self._bytecode_lock:
+            # Буфер пересоздаём только при смене длины байткода
+            if self._bytecode_input is None or tuple(self._bytecode_input.shape()) != features.shape:
+                self._bytecode_input = ort.OrtValue.ortvalue_from_shape_and_type(
+                    features.shape, np.float32, "cuda", 0
+                )
+                self._bytecode_binding.bind_ortvalue_input("bytecode", self._bytecode_input)
+            self._bytecode_input.update_inplace(features)
+            session.run_with_iobinding(self._bytecode_binding)
+            return self._bytecode_binding.copy_outputs_to_cpu()[0]
 
     def _init_vector_db(self):
-        """Инициализация Pinecone для векторного поиска"""
+        """Векторный поиск: локальный FAISS-индекс, при его отсутствии - Pinecone"""
+        if Path(FAISS_INDEX_PATH).exists() and Path(FAISS_METADATA_PATH).exists():
+            try:
+                self.vector_db = LocalContractIndex.load()
+                return
+            except Exception as e:
+                logger.error(f"FAISS index load failed, falling back to Pinecone: {str(e)}")
+
         try:
+            import pinecone
             pinecone.init(api_key="YOUR_PINECONE_KEY", environment="us-west1-gcp")
             self.vector_db = pinecone.Index("smart-contracts")
         except Exception as e:
@@ -108,11 +322,43 @@ class MLSecurityAnalyzer:
     def _load_known_attacks(self):
         """Загрузка известных атак"""
         try:
-            with open("data/known_attacks.json") as f:
-                self.known_attacks = json.load(f)
+            self.known_attacks = orjson.loads(Path("data/known_attacks.json").read_bytes())
         except Exception as e:
             logger.error(f"Failed to load attacks DB: {str(e)}")
             self.known_attacks = []
+        self._compile_attack_matchers()
+
+    def _compile_attack_matchers(self):
+        """
+        Скомпилированные один раз code_pattern (индекс атаки, regex)
+        и автомат Aho–Corasick для литеральных bytecode_pattern.
+        """
+        # Паттерны не объединяются в одну альтернативу: finditer по общему regex теряет
+        # совпадения, начинающиеся внутри предыдущего, а inline-флаги и \1 ломаются
+        self._code_patterns = []
+        for i, attack in enumerate(self.known_attacks):
+            if "code_pattern" not in attack:
+                continue
+            try:
+                compiled = re.compile(attack["code_pattern"])
+                if not _is_regex_safe(attack["code_pattern"]):
+                    logger.warning(f"Skipping attack pattern prone to catastrophic backtracking: {attack['code_pattern']!r}")
+                    continue
+            except re.error as e:
+                logger.warning(f"Skipping invalid attack pattern {attack['code_pattern']!r}: {str(e)}")
+                continue
+            self._code_patterns.append((i, compiled))
+
+        self._bytecode_patterns = {}
+        for i, attack in enumerate(self.known_attacks):
+            if attack.get("bytecode_pattern"):
+                self._bytecode_patterns.setdefault(attack["bytecode_pattern"], []).append(i)
+        self._bytecode_automaton = None
+        if ahocorasick is not None and self._bytecode_patterns:
+            self._bytecode_automaton = ahocorasick.Automaton()
+            for pattern, indices in self._bytecode_patterns.items():
+                self._bytecode_automaton.add_word(pattern, tuple(indices))
+            self._bytecode_automaton.make_automaton()
 
     async def full_analysis(self, contract: Dict, mode: AnalysisMode = AnalysisMode.BOTH) -> Dict:
         """Полный анализ контракта"""
@@ -125,33 +371,33 @@ class MLSecurityAnalyzer:
             "explanations": []
         }
 
-        # Параллельный запуск анализаторов
-        futures = []
+        # Параллельный запуск анализаторов в потоках, event loop не блокируется
+        tasks = []
         if mode in [AnalysisMode.CODE, AnalysisMode.BOTH] and "source_code" in contract:
-            futures.append(self.executor.submit(
+            tasks.append(self._run_in_thread(
                 self.analyze_source_code,
                 contract["source_code"]
             ))
 
         if mode in [AnalysisMode.BYTECODE, AnalysisMode.BOTH] and "bytecode" in contract:
-            futures.append(self.executor.submit(
+            tasks.append(self._run_in_thread(
                 self.analyze_bytecode,
                 contract["bytecode"]
             ))
 
-        if self.vector_db:
-            futures.append(self.executor.submit(
+        search_target = contract.get("source_code") or contract.get("bytecode")
+        if self.vector_db and search_target:
+            tasks.append(self._run_in_thread(
                 self.find_similar_contracts,
-                contract["source_code"] if "source_code" in contract else contract["bytecode"]
+                search_target
             ))
 
         # Обработка результатов
-        for future in futures:
-            try:
-                result = future.result(timeout=120)
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning(f"Analysis part failed: {str(result)}")
+            else:
                 analysis.update(result)
-            except Exception as e:
-                logger.warning(f"Analysis part failed: {str(e)}")
 
         # Дополнительные проверки
         analysis["known_attack_patterns"] = self._check_attack_patterns(
@@ -160,10 +406,18 @@ class MLSecurityAnalyzer:
         )
 
         analysis["risk_score"] = self._calculate_risk_score(analysis)
-        analysis["explanations"] = self._generate_explanations(analysis)
+        # Генерация LLM может не уложиться в ANALYSIS_TIMEOUT - уже готовые части не теряем
+        try:
+            analysis["explanations"] = await self._run_in_thread(self._generate_explanations, analysis)
+        except asyncio.TimeoutError:
+            logger.warning(f"Explanation generation exceeded {ANALYSIS_TIMEOUT}s, returning analysis without explanations")
 
         return analysis
 
+    async def _run_in_thread(self, func, *args):
+        """Выполняет блокирующий анализатор в потоке с общим таймаутом"""
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout=ANALYSIS_TIMEOUT)
+
     def analyze_source_code(self, code: str) -> Dict:
         """Анализ исходного кода"""
         result = {}
@@ -183,32 +437,63 @@ class MLSecurityAnalyzer:
         result = {}
         
         try:
-            # Нормализация байткода
-            clean_bytecode = self.w3.toHex(self.w3.toBytes(hexstr=bytecode))
+            # Нормализация байткода: hex -> байты -> float32-вектор без промежуточных копий
+            hex_str = bytecode[2:] if bytecode[:2] == "0x" else bytecode
+            features = np.frombuffer(bytes.fromhex(hex_str), dtype=np.uint8).astype(np.float32, copy=False)[None, :]
             
             # ONNX модели
             if self.models["bytecode_analysis"]:
-                inputs = {"bytecode": np.array([clean_bytecode], dtype=np.float32)}
-                outputs = self.models["bytecode_analysis"].run(None, inputs)
-                result["bytecode_analysis"] = outputs[0].tolist()
+                result["bytecode_analysis"] = self._run_bytecode_model(features).tolist()
 
             # Анализ аномалий
             if self.models["anomaly"]:
-                anomaly_score = self.models["anomaly"].predict(
-                    np.array([clean_bytecode])
-                )
-                result["anomaly_score"] = float(anomaly_score[0])
+                session = self.models["anomaly"]
+                outputs = session.run(None, {session.get_inputs()[0].name: features})
+                result["anomaly_score"] = float(outputs[0].reshape(-1)[0])
 
         except Exception as e:
             logger.error(f"Bytecode analysis failed: {str(e)}")
 
         return {"bytecode_analysis": result}
 
-    @lru_cache(maxsize=10000)
     def _get_code_embeddings(self, code: str) -> List[float]:
         """Генерация эмбеддингов кода с кешированием"""
-        model = SentenceTransformer("all-mpnet-base-v2", device=self.device)
-        return model.encode(code[:8192]).tolist()
+        text = code[:8192]
+        return self._emb_cache.get_or_compute(digest(text), lambda: self.encode_many([text])[0])
+
+    def encode_many(self, codes: List[str]) -> List[List[float]]:
+        """Эмбеддинги для списка исходников (INT8 ONNX, если модель экспортирована)"""
+        texts = [code[:8192] for code in codes]
+        embedder = _get_onnx_embedder(self.device)
+        if embedder:
+            return self._encode_onnx(embedder, texts)
+
+        embeddings = _get_sbert(self.device).encode(
+            texts,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        return embeddings.tolist()
+
+    def _encode_onnx(self, embedder, texts: List[str]) -> List[List[float]]:
+        """Mean pooling по last_hidden_state + L2-нормализация (как у SentenceTransformer)"""
+        session, tokenizer = embedder
+        input_names = [i.name for i in session.get_inputs()]
+        batches = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            encoded = tokenizer(
+                texts[start:start + EMBEDDING_BATCH_SIZE],
+                padding=True,
+                truncation=True,
+                max_length=EMBEDDING_MAX_LENGTH,
+                return_tensors="np"
+            )
+            hidden = session.run(None, {name: encoded[name] for name in input_names})[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.vstack(batches).tolist()
 
     def find_similar_contracts(self, code_or_bytecode: str) -> Dict:
         """Поиск похожих контрактов в векторной БД"""
@@ -244,53 +529,72 @@ class MLSecurityAnalyzer:
 
     def _check_attack_patterns(self, code_analysis: Dict, bytecode_analysis: Dict) -> List[Dict]:
         """Проверка на известные шаблоны атак"""
-        detected = []
-        
-        for attack in self.known_attacks:
-            # Проверка по исходному коду
-            if "code_pattern" in attack:
-                if re.search(attack["code_pattern"], str(code_analysis)):
-                    detected.append(attack)
+        code_text = str(code_analysis) if self._code_patterns else ""
+        bytecode_text = str(bytecode_analysis) if bytecode_analysis and self._bytecode_patterns else ""
+        key = digest(code_text + "\0" + bytecode_text)
+        code_hits, bytecode_hits = self._attack_cache.get_or_compute(
+            key, lambda: self._scan_attack_texts(code_text, bytecode_text)
+        )
 
-            # Проверка по байткоду
-            if "bytecode_pattern" in attack and bytecode_analysis:
-                if attack["bytecode_pattern"] in str(bytecode_analysis):
-                    detected.append(attack)
+        detected = []
+        for i, attack in enumerate(self.known_attacks):
+            if i in code_hits:
+                detected.append(attack)
+            if i in bytecode_hits:
+                detected.append(attack)
 
         return detected
 
+    def _scan_attack_texts(self, code_text: str, bytecode_text: str) -> Tuple[frozenset, frozenset]:
+        """Индексы атак, найденных в коде и байткоде"""
+        # Проверка по исходному коду: каждый паттерн по одному и тому же тексту
+        code_hits = set()
+        if code_text:
+            for i, compiled in self._code_patterns:
+                if compiled.search(code_text):
+                    code_hits.add(i)
+
+        # Проверка по байткоду: один проход Aho–Corasick
+        bytecode_hits = set()
+        if bytecode_text:
+            if self._bytecode_automaton is not None:
+                for _, indices in self._bytecode_automaton.iter(bytecode_text):
+                    bytecode_hits.update(indices)
+            else:
+                for pattern, indices in self._bytecode_patterns.items():
+                    if pattern in bytecode_text:
+                        bytecode_hits.update(indices)
+
+        return frozenset(code_hits), frozenset(bytecode_hits)
+
+    @staticmethod
+    def _risk_components(analysis: Dict) -> np.ndarray:
+        """Компоненты риска: уязвимости кода, аномалии байткода, известные атаки, похожие контракты"""
+        # Пайплайн классификации возвращает список [{label, score}]
+        vulnerabilities = analysis.get("code_analysis", {}).get("vulnerabilities", {})
+        if isinstance(vulnerabilities, list):
+            vulnerabilities = vulnerabilities[0] if vulnerabilities else {}
+
+        similar = analysis.get("similar_contracts") or []
+        avg_similarity = sum(c["similarity"] for c in similar) / len(similar) if similar else 0.0
+
+        return np.array([
+            vulnerabilities.get("score", 0.0),
+            analysis.get("bytecode_analysis", {}).get("anomaly_score", 0.0),
+            min(1.0, len(analysis.get("known_attack_patterns") or []) * 0.5),
+            avg_similarity
+        ], dtype=np.float32)
+
     def _calculate_risk_score(self, analysis: Dict) -> float:
         """Вычисление риска"""
-        score = 0.0
-        
-        # Веса для разных компонентов
-        weights = {
-            "code_vulnerabilities": 0.4,
-            "bytecode_anomalies": 0.3,
-            "attack_patterns": 0.2,
-            "similar_contracts": 0.1
-        }
-
-        # Оценка на основе кода
-        if "code_analysis" in analysis and "vulnerabilities" in analysis["code_analysis"]:
-            score += weights["code_vulnerabilities"] * analysis["code_analysis"]["vulnerabilities"]["score"]
-
-        # Оценка
-        if "bytecode_analysis" in analysis and "anomaly_score" in analysis["bytecode_analysis"]:
-            score += weights["bytecode_anomalies"] * analysis["bytecode_analysis"]["anomaly_score"]
-
-        # Штраф 
-        if analysis["known_attack_patterns"]:
-            score += weights["attack_patterns"] * min(1.0, len(analysis["known_attack_patterns"]) * 0.5)
+        return float(min(1.0, self._risk_components(analysis) @ self._W))
 
-        # Корректировка
-        if analysis["similar_contracts"]:
-            avg_similarity = sum(
-                c["similarity"] for c in analysis["similar_contracts"]
-            ) / len(analysis["similar_contracts"])
-            score += weights["similar_contracts"] * avg_similarity
-
-        return min(1.0, score)
+    def batch_risk_score(self, analyses: List[Dict]) -> np.ndarray:
+        """Риск для пачки анализов одним матричным умножением"""
+        if not analyses:
+            return np.zeros(0, dtype=np.float32)
+        components = np.stack([self._risk_components(a) for a in analyses])
+        return np.clip(components @ self._W, 0.0, 1.0)
 
     def _generate_explanations(self, analysis: Dict) -> List[str]:
         """Генерация объяснений nlp"""
@@ -299,37 +603,59 @@ class MLSecurityAnalyzer:
         if not self.models["explanation"]:
             return explanations
 
-        try:
-            # Генерация объяснения для кода
-            if "code_analysis" in analysis:
-                prompt = f"""
+        prompts = []
+
+        # Объяснение для кода
+        code_analysis = analysis.get("code_analysis", {})
+        if "vulnerabilities" in code_analysis:
+            prompts.append(f"""
                 Analyze these code vulnerabilities:
-                {json.dumps(analysis['code_analysis']['vulnerabilities'], indent=2)}
+                {_dumps_indented(code_analysis['vulnerabilities'])}
                 
                 Provide:
                 1. Risk assessment
                 2. Potential impact
                 3. Recommended fixes
-                """
-                explanations.append(
-                    self.models["explanation"](prompt, max_length=500)[0]["generated_text"]
-                )
-
-            # Генерация объяснения для байткода
-            if "bytecode_analysis" in analysis:
-                prompt = f"""
-                Analyze these bytecode anomalies (score: {analysis['bytecode_analysis']['anomaly_score']}):
-                {json.dumps(analysis['bytecode_analysis'], indent=2)}
+                """)
+
+        # Объяснение для байткода
+        bytecode_analysis = analysis.get("bytecode_analysis", {})
+        if bytecode_analysis:
+            prompts.append(f"""
+                Analyze these bytecode anomalies (score: {bytecode_analysis.get('anomaly_score')}):
+                {_dumps_indented(bytecode_analysis)}
                 
                 Explain potential issues in the bytecode.
-                """
-                explanations.append(
-                    self.models["explanation"](prompt, max_length=500)[0]["generated_text"]
-                )
+                """)
+
+        if not prompts:
+            return explanations
+
+        try:
+            # Оба промпта одним батчем: один запуск генерации вместо двух
+            generator = self.models["explanation"]
+            outputs = generator(
+                prompts,
+                batch_size=len(prompts),
+                max_new_tokens=500,
+                do_sample=False,
+                pad_token_id=generator.tokenizer.eos_token_id
+            )
+            explanations.extend(output[0]["generated_text"] for output in outputs)
 
         except Exception as e:
             logger.error(f"Explanation generation failed: {str(e)}")
 
         return explanations
 
-ml_analyzer = MLSecurityAnalyzer()
+_analyzer: Optional[MLSecurityAnalyzer] = None
+_analyzer_lock = threading.Lock()
+
+def get_analyzer() -> MLSecurityAnalyzer:
+    """Анализатор создаётся при первом обращении (загрузка моделей - секунды и сотни МБ)"""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = MLSecurityAnalyzer()
+    return _analyzer